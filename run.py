@@ -8,6 +8,14 @@ def run_geocoder():
     from subway_locator.utils.geocoder import run
     run()
 
+def run_pipeline():
+    from subway_locator.pipeline.pipeline import run
+    run()
+
+def run_refresh():
+    from subway_locator.pipeline.pipeline import run
+    run(incremental=True)
+
 def run_api():
     import uvicorn
     uvicorn.run("subway_locator.api.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -18,7 +26,7 @@ def run_frontend():
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Subway Outlet Locator')
-    parser.add_argument('component', choices=['scraper', 'geocoder', 'api', 'frontend'],
+    parser.add_argument('component', choices=['scraper', 'geocoder', 'pipeline', 'refresh', 'api', 'frontend'],
                         help='Component to run')
     
     args = parser.parse_args()
@@ -27,6 +35,10 @@ if __name__ == "__main__":
         run_scraper()
     elif args.component == 'geocoder':
         run_geocoder()
+    elif args.component == 'pipeline':
+        run_pipeline()
+    elif args.component == 'refresh':
+        run_refresh()
     elif args.component == 'api':
         run_api()
     elif args.component == 'frontend':
@@ -0,0 +1 @@
+from . import geo, coverage, neighbours
\ No newline at end of file
@@ -0,0 +1,164 @@
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+from .geo import METERS_PER_DEGREE, haversine_m, load_outlet_coordinates, coordinates_signature
+from ..database.models import get_dataset_version
+
+DEFAULT_CELL_M = 250
+
+# Refuse grids larger than this many cells
+MAX_CELLS = 1_000_000
+
+# Upper bound on cell/outlet distance pairs evaluated at once. haversine_m
+# holds about five float64 temporaries per pair, so peak working memory is
+# roughly 40 bytes * CHUNK_PAIRS (about 40 MB) whatever the grid or outlet count.
+CHUNK_PAIRS = 1_000_000
+
+# Number of computed grids kept in memory
+CACHE_SIZE = 16
+
+# Color stops for the heatmaps as (value, (r, g, b, a))
+COUNT_STOPS = [
+    (0, (0, 0, 0, 0)),
+    (1, (0, 153, 89, 110)),
+    (3, (255, 193, 7, 150)),
+    (6, (220, 53, 69, 190)),
+]
+GAP_STOPS = [
+    (0.0, (0, 153, 89, 110)),
+    (0.5, (255, 193, 7, 140)),
+    (1.0, (220, 53, 69, 170)),
+]
+
+class CoverageGrid:
+    """Outlet coverage counts and nearest-outlet distances on a lat/lon grid
+    
+    Arrays are row-major with the first row at the northern edge, so they
+    map directly onto an image overlay spanning (south, west, north, east).
+    """
+    
+    def __init__(self, bounds, cell_m, radius_m, counts, nearest_m):
+        self.bounds = bounds
+        self.cell_m = cell_m
+        self.radius_m = radius_m
+        self.counts = counts
+        self.nearest_m = nearest_m
+    
+    @property
+    def shape(self):
+        return self.counts.shape
+    
+    def to_bytes(self, layer):
+        """Raw little-endian grid: uint16 counts or float32 distances in meters"""
+        if layer == "count":
+            return self.counts.astype("<u2").tobytes()
+        return self.nearest_m.astype("<f4").tobytes()
+    
+    def to_png(self, layer):
+        """Render a layer as an RGBA heatmap PNG"""
+        if layer == "count":
+            rgba = _apply_ramp(self.counts, COUNT_STOPS)
+        else:
+            rgba = _apply_ramp(self.nearest_m / self.radius_m, GAP_STOPS)
+        return encode_png(rgba)
+
+def compute_coverage(latitudes, longitudes, radius_m, cell_m=DEFAULT_CELL_M, bounds=None, chunk_pairs=CHUNK_PAIRS):
+    """Rasterize outlet catchments of radius_m onto a grid of roughly cell_m cells"""
+    if len(latitudes) == 0:
+        raise ValueError("No geocoded outlets to compute coverage for")
+    
+    if bounds is None:
+        # Pad the outlets' bounding box so every catchment fits on the grid
+        pad_lat = radius_m / METERS_PER_DEGREE
+        pad_lon = pad_lat / np.cos(np.radians(np.mean(latitudes)))
+        bounds = (
+            float(latitudes.min() - pad_lat), float(longitudes.min() - pad_lon),
+            float(latitudes.max() + pad_lat), float(longitudes.max() + pad_lon)
+        )
+    south, west, north, east = bounds
+    
+    lat_step = cell_m / METERS_PER_DEGREE
+    lon_step = lat_step / np.cos(np.radians((south + north) / 2))
+    rows = max(1, int(np.ceil((north - south) / lat_step)))
+    cols = max(1, int(np.ceil((east - west) / lon_step)))
+    if rows * cols > MAX_CELLS:
+        raise ValueError(f"Grid of {rows}x{cols} cells exceeds the limit of {MAX_CELLS}; use a larger cell size")
+    
+    # Cell centres, northern row first
+    cell_lats = north - (np.arange(rows) + 0.5) * (north - south) / rows
+    cell_lons = west + (np.arange(cols) + 0.5) * (east - west) / cols
+    
+    counts = np.zeros((rows, cols), dtype=np.uint16)
+    nearest_m = np.full((rows, cols), np.inf, dtype=np.float32)
+    
+    # Split outlets, then columns, then rows so no block exceeds chunk_pairs
+    outlets_per_block = min(len(latitudes), chunk_pairs)
+    cols_per_block = min(cols, max(1, chunk_pairs // outlets_per_block))
+    rows_per_block = min(rows, max(1, chunk_pairs // (outlets_per_block * cols_per_block)))
+    for o_start in range(0, len(latitudes), outlets_per_block):
+        o_stop = o_start + outlets_per_block
+        block_lats = latitudes[None, None, o_start:o_stop]
+        block_lons = longitudes[None, None, o_start:o_stop]
+        for r_start in range(0, rows, rows_per_block):
+            r_stop = r_start + rows_per_block
+            for c_start in range(0, cols, cols_per_block):
+                c_stop = c_start + cols_per_block
+                distances = haversine_m(
+                    cell_lats[r_start:r_stop, None, None], cell_lons[None, c_start:c_stop, None],
+                    block_lats, block_lons
+                )
+                counts[r_start:r_stop, c_start:c_stop] += (distances <= radius_m).sum(axis=2, dtype=np.uint16)
+                np.minimum(
+                    nearest_m[r_start:r_stop, c_start:c_stop], distances.min(axis=2),
+                    out=nearest_m[r_start:r_stop, c_start:c_stop]
+                )
+    
+    return CoverageGrid(bounds, cell_m, radius_m, counts, nearest_m)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_coverage(db, radius_m, cell_m=DEFAULT_CELL_M):
+    """Return the coverage grid for the current dataset version, computing it on a cache miss"""
+    key = (get_dataset_version(db), coordinates_signature(db), radius_m, cell_m)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    
+    _, latitudes, longitudes = load_outlet_coordinates(db)
+    grid = compute_coverage(latitudes, longitudes, radius_m, cell_m)
+    
+    with _cache_lock:
+        _cache[key] = grid
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return grid
+
+def _apply_ramp(values, stops):
+    """Map values onto RGBA colors by interpolating between color stops"""
+    positions = [stop[0] for stop in stops]
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    for channel in range(4):
+        rgba[..., channel] = np.interp(values, positions, [stop[1][channel] for stop in stops])
+    return rgba
+
+def encode_png(rgba):
+    """Encode an (height, width, 4) uint8 array as a PNG"""
+    height, width, _ = rgba.shape
+    
+    # Each scanline is prefixed with filter type 0 (none)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(height, width * 4)
+    
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
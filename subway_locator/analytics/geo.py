@@ -0,0 +1,46 @@
+import numpy as np
+from sqlalchemy import func
+from ..database.models import SubwayOutlet
+
+# Mean Earth radius in meters
+EARTH_RADIUS_M = 6371008.8
+
+# Length of one degree of latitude in meters
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS_M / 180
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters between broadcastable arrays of degrees"""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def coordinates_signature(db):
+    """Cheap aggregate over outlet ids and coordinates that changes whenever they do
+
+    Read-side caches key on this alongside the dataset version, so a write
+    path that forgets to bump the version still cannot leave them stale.
+    """
+    return tuple(db.query(
+        func.count(SubwayOutlet.id),
+        func.sum(SubwayOutlet.id),
+        func.sum(SubwayOutlet.latitude),
+        func.sum(SubwayOutlet.longitude),
+        func.sum(SubwayOutlet.id * SubwayOutlet.latitude),
+        func.sum(SubwayOutlet.id * SubwayOutlet.longitude)
+    ).filter(
+        SubwayOutlet.latitude.isnot(None),
+        SubwayOutlet.longitude.isnot(None)
+    ).one())
+
+def load_outlet_coordinates(db):
+    """Return (ids, latitudes, longitudes) arrays for all geocoded outlets, ordered by id"""
+    rows = db.query(SubwayOutlet.id, SubwayOutlet.latitude, SubwayOutlet.longitude).filter(
+        SubwayOutlet.latitude.isnot(None),
+        SubwayOutlet.longitude.isnot(None)
+    ).order_by(SubwayOutlet.id).all()
+    
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    latitudes = np.array([row[1] for row in rows], dtype=np.float64)
+    longitudes = np.array([row[2] for row in rows], dtype=np.float64)
+    return ids, latitudes, longitudes
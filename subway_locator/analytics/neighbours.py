@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import os
+import threading
+import numpy as np
+from .geo import haversine_m, load_outlet_coordinates, coordinates_signature
+from ..database.models import get_dataset_version
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Neighbours are recorded up to this distance; catchment overlap queries
+# need neighbours within twice the catchment radius
+MAX_RADIUS_M = 20_000
+
+# Number of nearest neighbours recorded for every outlet
+K_NEAREST = 10
+
+# Upper bound on outlet pairs evaluated at once while building
+CHUNK_PAIRS = 4_000_000
+
+GRAPH_PATH = os.path.join("cache", "neighbour_graph.npz")
+
+def coordinates_digest(ids, latitudes, longitudes):
+    """Hash outlet ids and coordinates, so the graph is only rebuilt when they change"""
+    digest = hashlib.sha256()
+    for array in (ids.astype("<i8"), latitudes.astype("<f8"), longitudes.astype("<f8")):
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+class NeighbourGraph:
+    """Sparse outlet-to-outlet distance graph
+    
+    Neighbours within max_radius_m are kept in CSR form: the neighbours of
+    outlet i are indices[indptr[i]:indptr[i + 1]], sorted by distance.
+    The k nearest neighbours are kept separately in dense (n, k) arrays,
+    with k capped at n - 1. Positions refer to the ids array, not to
+    outlet ids.
+    """
+    
+    def __init__(self, ids, indptr, indices, distances, knn_indices, knn_distances, max_radius_m, digest):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self.distances = distances
+        self.knn_indices = knn_indices
+        self.knn_distances = knn_distances
+        self.max_radius_m = max_radius_m
+        self.digest = digest
+        self.positions = {int(outlet_id): position for position, outlet_id in enumerate(ids)}
+        # Row position of every CSR entry, for vectorized per-outlet counts
+        self.rows = np.repeat(np.arange(len(ids)), np.diff(indptr))
+    
+    @classmethod
+    def build(cls, ids, latitudes, longitudes, max_radius_m=MAX_RADIUS_M, k=K_NEAREST, chunk_pairs=CHUNK_PAIRS):
+        n = len(ids)
+        k = min(k, max(n - 1, 0))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indices = []
+        distances = []
+        knn_indices = np.full((n, k), -1, dtype=np.int32)
+        knn_distances = np.full((n, k), np.inf, dtype=np.float32)
+        
+        rows_per_chunk = max(1, chunk_pairs // max(n, 1))
+        for start in range(0, n, rows_per_chunk):
+            stop = min(start + rows_per_chunk, n)
+            chunk = haversine_m(
+                latitudes[start:stop, None], longitudes[start:stop, None],
+                latitudes[None, :], longitudes[None, :]
+            )
+            # An outlet is not its own neighbour
+            chunk[np.arange(stop - start), np.arange(start, stop)] = np.inf
+            
+            order = np.argsort(chunk, axis=1)
+            ordered = np.take_along_axis(chunk, order, axis=1)
+            knn_indices[start:stop] = order[:, :k]
+            knn_distances[start:stop] = ordered[:, :k]
+            
+            # Boolean indexing walks rows in order, so each row stays sorted
+            within = ordered <= max_radius_m
+            indptr[start + 1:stop + 1] = within.sum(axis=1)
+            indices.append(order[within].astype(np.int32))
+            distances.append(ordered[within].astype(np.float32))
+        
+        np.cumsum(indptr, out=indptr)
+        return cls(
+            ids, indptr,
+            np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+            np.concatenate(distances) if distances else np.zeros(0, dtype=np.float32),
+            knn_indices, knn_distances, max_radius_m,
+            coordinates_digest(ids, latitudes, longitudes)
+        )
+    
+    def save(self, path=GRAPH_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path, ids=self.ids, indptr=self.indptr, indices=self.indices,
+            distances=self.distances, knn_indices=self.knn_indices,
+            knn_distances=self.knn_distances, max_radius_m=self.max_radius_m,
+            digest=self.digest
+        )
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path=GRAPH_PATH):
+        with np.load(path) as data:
+            return cls(
+                data["ids"], data["indptr"], data["indices"], data["distances"],
+                data["knn_indices"], data["knn_distances"],
+                float(data["max_radius_m"]), str(data["digest"])
+            )
+    
+    def _check_radius(self, radius_m):
+        if radius_m > self.max_radius_m:
+            raise ValueError(f"Radius exceeds the supported maximum of {self.max_radius_m / 1000:g} km")
+    
+    def neighbours(self, outlet_id, radius_m):
+        """Return (ids, distances) of the outlets within radius_m of an outlet, nearest first"""
+        self._check_radius(radius_m)
+        position = self.positions[outlet_id]
+        start, stop = self.indptr[position], self.indptr[position + 1]
+        end = start + np.searchsorted(self.distances[start:stop], radius_m, side="right")
+        return self.ids[self.indices[start:end]], self.distances[start:end]
+    
+    def nearest(self, outlet_id, k):
+        """Return (ids, distances) of up to k nearest outlets"""
+        position = self.positions[outlet_id]
+        return self.ids[self.knn_indices[position, :k]], self.knn_distances[position, :k]
+    
+    def neighbour_counts(self, radius_m):
+        """Number of other outlets within radius_m of each outlet"""
+        self._check_radius(radius_m)
+        return np.bincount(self.rows[self.distances <= radius_m], minlength=len(self.ids))
+    
+    def overlap_scores(self, radius_m):
+        """Sum over neighbours of the fraction of each outlet's catchment they overlap
+        
+        A score of 1.0 means the equivalent of one full catchment is shared
+        with other outlets.
+        """
+        self._check_radius(2 * radius_m)
+        mask = self.distances < 2 * radius_m
+        d = self.distances[mask].astype(np.float64)
+        
+        # Area of the lens where two circles of radius r at distance d intersect
+        r = radius_m
+        lens = 2 * r * r * np.arccos(d / (2 * r)) - (d / 2) * np.sqrt(4 * r * r - d * d)
+        return np.bincount(self.rows[mask], weights=lens / (np.pi * r * r), minlength=len(self.ids))
+
+def _load_saved_graph():
+    if not os.path.exists(GRAPH_PATH):
+        return None
+    try:
+        return NeighbourGraph.load()
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not load neighbour graph: {str(e)}")
+        return None
+
+_graph = None
+_graph_version = None
+_graph_lock = threading.Lock()
+
+def get_neighbour_graph(db):
+    """Return the neighbour graph for the current data, rebuilding it if coordinates changed"""
+    global _graph, _graph_version
+    
+    version = (get_dataset_version(db), coordinates_signature(db))
+    with _graph_lock:
+        if _graph is not None and _graph_version == version:
+            return _graph
+        
+        ids, latitudes, longitudes = load_outlet_coordinates(db)
+        digest = coordinates_digest(ids, latitudes, longitudes)
+        
+        # Refreshes that only touched hours or links keep the existing graph
+        if _graph is None or _graph.digest != digest:
+            # The pipeline saves a graph after each refresh, which spares this process a rebuild
+            stored = _load_saved_graph()
+            if stored is not None and stored.digest == digest:
+                _graph = stored
+        
+        if _graph is None or _graph.digest != digest:
+            logger.info(f"Building neighbour graph for {len(ids)} outlets")
+            _graph = NeighbourGraph.build(ids, latitudes, longitudes)
+            try:
+                _graph.save()
+            except OSError as e:
+                logger.warning(f"Could not save neighbour graph: {str(e)}")
+        
+        _graph_version = version
+        return _graph
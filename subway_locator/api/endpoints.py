@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..database.database import get_db
-from ..database.models import SubwayOutlet
+from ..database.models import SubwayOutlet, get_dataset_version
+from ..analytics.coverage import DEFAULT_CELL_M, get_coverage
+from ..analytics.neighbours import MAX_RADIUS_M, K_NEAREST, get_neighbour_graph
 from pydantic import BaseModel
+import numpy as np
 
 router = APIRouter()
 
@@ -22,10 +25,18 @@ class OutletResponse(BaseModel):
 
 @router.get("/outlets", response_model=List[OutletResponse])
 def get_outlets(
+    request: Request,
+    response: Response,
     geocoded_only: bool = Query(False, description="Filter to only return outlets with coordinates"),
     db: Session = Depends(get_db)
 ):
     """Get all outlets"""
+    # The list only changes when a refresh bumps the dataset version
+    etag = f'W/"outlets-{get_dataset_version(db)}-{int(geocoded_only)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    
     query = db.query(SubwayOutlet)
     
     if geocoded_only:
@@ -74,4 +85,121 @@ def get_latest_closing_outlets(db: Session = Depends(get_db)):
     # This is a simplified version - in reality, you would need to parse
     # the operating hours strings and compare them
     outlets = db.query(SubwayOutlet).order_by(SubwayOutlet.operating_hours.desc()).limit(5).all()
-    return outlets
\ No newline at end of file
+    return outlets
+
+@router.get("/coverage/grid")
+def coverage_grid(
+    radius_km: float = Query(5.0, gt=0, le=20, description="Catchment radius in kilometres"),
+    cell_m: int = Query(DEFAULT_CELL_M, ge=50, le=5000, description="Grid cell size in meters"),
+    layer: str = Query("count", pattern="^(count|distance)$", description="Outlets covering each cell, or distance to the nearest outlet"),
+    format: str = Query("png", pattern="^(png|bin)$", description="PNG heatmap or raw little-endian array"),
+    db: Session = Depends(get_db)
+):
+    """Get the outlet coverage grid as a heatmap image or binary array"""
+    try:
+        grid = get_coverage(db, radius_km * 1000, cell_m)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Grid geometry travels in headers so the body stays a plain image/array
+    headers = {
+        "X-Grid-Bounds": ",".join(f"{value:.6f}" for value in grid.bounds),
+        "X-Grid-Shape": f"{grid.shape[0]},{grid.shape[1]}",
+    }
+    if format == "png":
+        return Response(content=grid.to_png(layer), media_type="image/png", headers=headers)
+    
+    headers["X-Grid-Dtype"] = "uint16" if layer == "count" else "float32"
+    return Response(content=grid.to_bytes(layer), media_type="application/octet-stream", headers=headers)
+
+def _outlet_names(db, outlet_ids):
+    """Look up names for a set of outlet ids"""
+    rows = db.query(SubwayOutlet.id, SubwayOutlet.name).filter(SubwayOutlet.id.in_(outlet_ids)).all()
+    return {row[0]: row[1] for row in rows}
+
+@router.get("/outlets/{outlet_id}/neighbours")
+def get_outlet_neighbours(
+    outlet_id: int,
+    radius_km: Optional[float] = Query(None, gt=0, le=MAX_RADIUS_M / 1000, description="Return all neighbours within this radius instead of the k nearest"),
+    k: int = Query(5, ge=1, le=K_NEAREST, description="Number of nearest neighbours"),
+    db: Session = Depends(get_db)
+):
+    """Get the nearest outlets to an outlet"""
+    graph = get_neighbour_graph(db)
+    if outlet_id not in graph.positions:
+        raise HTTPException(status_code=404, detail="Outlet not found or not geocoded")
+    
+    if radius_km is not None:
+        ids, distances = graph.neighbours(outlet_id, radius_km * 1000)
+    else:
+        ids, distances = graph.nearest(outlet_id, k)
+    
+    names = _outlet_names(db, [int(i) for i in ids])
+    return {
+        "outlet_id": outlet_id,
+        "neighbours": [
+            {"id": int(i), "name": names.get(int(i)), "distance_km": round(float(d) / 1000, 3)}
+            for i, d in zip(ids, distances)
+        ]
+    }
+
+@router.get("/analytics/isolated")
+def get_isolated_outlets(
+    radius_km: float = Query(3.0, gt=0, le=MAX_RADIUS_M / 1000, description="Outlets with no neighbour within this radius"),
+    db: Session = Depends(get_db)
+):
+    """Get outlets with no other outlet within the radius"""
+    graph = get_neighbour_graph(db)
+    isolated = np.flatnonzero(graph.neighbour_counts(radius_km * 1000) == 0)
+    
+    names = _outlet_names(db, [int(graph.ids[i]) for i in isolated])
+    outlets = []
+    for position in isolated:
+        outlet_id = int(graph.ids[position])
+        outlet = {"id": outlet_id, "name": names.get(outlet_id), "nearest_id": None, "nearest_km": None}
+        if graph.knn_indices.shape[1]:
+            outlet["nearest_id"] = int(graph.ids[graph.knn_indices[position, 0]])
+            outlet["nearest_km"] = round(float(graph.knn_distances[position, 0]) / 1000, 3)
+        outlets.append(outlet)
+    
+    return {"radius_km": radius_km, "count": len(outlets), "outlets": outlets}
+
+@router.get("/analytics/crowding")
+def get_crowded_outlets(
+    radius_km: float = Query(5.0, gt=0, le=MAX_RADIUS_M / 1000, description="Catchment radius"),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Get the outlets with the most other outlets inside their catchment"""
+    graph = get_neighbour_graph(db)
+    counts = graph.neighbour_counts(radius_km * 1000)
+    top = np.argsort(-counts, kind="stable")[:limit]
+    
+    names = _outlet_names(db, [int(graph.ids[i]) for i in top])
+    return {
+        "radius_km": radius_km,
+        "outlets": [
+            {"id": int(graph.ids[i]), "name": names.get(int(graph.ids[i])), "neighbours": int(counts[i])}
+            for i in top
+        ]
+    }
+
+@router.get("/analytics/cannibalization")
+def get_cannibalization_scores(
+    radius_km: float = Query(5.0, gt=0, le=MAX_RADIUS_M / 2000, description="Catchment radius"),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Get the outlets whose catchment overlaps most with other outlets' catchments"""
+    graph = get_neighbour_graph(db)
+    scores = graph.overlap_scores(radius_km * 1000)
+    top = np.argsort(-scores, kind="stable")[:limit]
+    
+    names = _outlet_names(db, [int(graph.ids[i]) for i in top])
+    return {
+        "radius_km": radius_km,
+        "outlets": [
+            {"id": int(graph.ids[i]), "name": names.get(int(graph.ids[i])), "score": round(float(scores[i]), 3)}
+            for i in top
+        ]
+    }
\ No newline at end of file
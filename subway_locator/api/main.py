@@ -11,6 +11,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Grid-Bounds", "X-Grid-Shape", "X-Grid-Dtype"],
 )
 
 # Include router
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Text
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime
+from datetime import datetime
 from .database import Base
 
 class SubwayOutlet(Base):
@@ -13,4 +14,51 @@ class SubwayOutlet(Base):
     longitude = Column(Float, nullable=True)
     
     def __repr__(self):
-        return f"<SubwayOutlet(name='{self.name}', address='{self.address}')>"
\ No newline at end of file
+        return f"<SubwayOutlet(name='{self.name}', address='{self.address}')>"
+
+class PipelineCheckpoint(Base):
+    __tablename__ = "pipeline_checkpoints"
+    
+    # One row per outlet stored by an unfinished pipeline run
+    outlet_key = Column(String(64), primary_key=True)
+    outlet_id = Column(Integer, index=True)
+    
+    def __repr__(self):
+        return f"<PipelineCheckpoint(outlet_key='{self.outlet_key}', outlet_id={self.outlet_id})>"
+
+class OutletFingerprint(Base):
+    __tablename__ = "outlet_fingerprints"
+    
+    # Keyed by the id in the locator's /find-a-subway?id=N&view=location links
+    locator_id = Column(Integer, primary_key=True)
+    outlet_id = Column(Integer, index=True)
+    fingerprint = Column(String(64))
+    
+    def __repr__(self):
+        return f"<OutletFingerprint(locator_id={self.locator_id}, outlet_id={self.outlet_id})>"
+
+class DatasetVersion(Base):
+    __tablename__ = "dataset_version"
+    
+    # Single row, bumped whenever the outlet data changes
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<DatasetVersion(version={self.version}, updated_at='{self.updated_at}')>"
+
+def get_dataset_version(db):
+    """Return the current outlet dataset version"""
+    row = db.query(DatasetVersion).filter(DatasetVersion.id == 1).first()
+    return row.version if row else 0
+
+def bump_dataset_version(db):
+    """Increment the dataset version as part of the caller's transaction"""
+    row = db.query(DatasetVersion).filter(DatasetVersion.id == 1).first()
+    if row is None:
+        row = DatasetVersion(id=1, version=0)
+        db.add(row)
+    row.version += 1
+    row.updated_at = datetime.utcnow()
+    return row.version
\ No newline at end of file
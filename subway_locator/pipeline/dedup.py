@@ -0,0 +1,184 @@
+import logging
+import math
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Precision 7 cells are roughly 150m x 150m
+GEOHASH_PRECISION = 7
+
+# Minimum similarity (0-1) for two names or addresses to count as the same
+NAME_THRESHOLD = 0.85
+ADDRESS_THRESHOLD = 0.8
+
+# Outlets further apart than this are never the same outlet
+MAX_MATCH_DISTANCE_M = 300
+
+# Fields copied onto the surviving record when it is missing them
+MERGE_FIELDS = ("name", "address", "operating_hours", "waze_link", "latitude", "longitude", "locator_id")
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits = bits << 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def geohash_cells(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Return the geohash cell of a coordinate and its eight neighbours"""
+    # Cell size in degrees for this precision
+    lon_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    lat_size = 180.0 / (1 << lat_bits)
+    lon_size = 360.0 / (1 << lon_bits)
+    
+    cells = set()
+    for d_lat in (-1, 0, 1):
+        for d_lon in (-1, 0, 1):
+            lat = min(max(latitude + d_lat * lat_size, -90.0), 90.0)
+            lon = (longitude + d_lon * lon_size + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(lat, lon, precision))
+    return cells
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and the brand name, and collapse whitespace"""
+    text = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    text = re.sub(r"\bsubway\b", " ", text)
+    return " ".join(text.split())
+
+def _similarity(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+def _distance_m(a, b):
+    """Haversine distance in meters between two outlets' coordinates"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a["latitude"], a["longitude"], b["latitude"], b["longitude"]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(min(h, 1.0)))
+
+def _has_coordinates(outlet):
+    return outlet.get("latitude") is not None and outlet.get("longitude") is not None
+
+class OutletDeduplicator:
+    """Incrementally detect duplicate outlets using blocking keys and fuzzy matching
+    
+    Each outlet is only compared against earlier outlets sharing a block:
+    the same locator id, the same normalized name, or a nearby geohash cell.
+    """
+    
+    def __init__(self, name_threshold=NAME_THRESHOLD, address_threshold=ADDRESS_THRESHOLD,
+                 geohash_precision=GEOHASH_PRECISION, max_distance_m=MAX_MATCH_DISTANCE_M):
+        self.name_threshold = name_threshold
+        self.address_threshold = address_threshold
+        self.max_distance_m = max_distance_m
+        self.geohash_precision = geohash_precision
+        self.records = []
+        self.blocks = defaultdict(list)
+        self.duplicates = 0
+    
+    def add(self, outlet):
+        """Add an outlet and return (record, is_duplicate)
+        
+        Duplicates are merged into the record they match, which is returned
+        in place of the new outlet.
+        """
+        for index in self._candidates(outlet):
+            record = self.records[index]
+            if self._is_match(record, outlet):
+                self._merge(record, outlet)
+                self._index(index, record)
+                self.duplicates += 1
+                return record, True
+        
+        self.records.append(outlet)
+        self._index(len(self.records) - 1, outlet)
+        return outlet, False
+    
+    def _blocking_keys(self, outlet):
+        keys = set()
+        if outlet.get("locator_id") is not None:
+            keys.add(("id", outlet["locator_id"]))
+        
+        name = normalize_text(outlet.get("name"))
+        if name:
+            keys.add(("name", name))
+        
+        if _has_coordinates(outlet):
+            for cell in geohash_cells(outlet["latitude"], outlet["longitude"], self.geohash_precision):
+                keys.add(("cell", cell))
+        return keys
+    
+    def _candidates(self, outlet):
+        seen = set()
+        for key in self._blocking_keys(outlet):
+            for index in self.blocks.get(key, []):
+                if index not in seen:
+                    seen.add(index)
+                    yield index
+    
+    def _index(self, index, outlet):
+        for key in self._blocking_keys(outlet):
+            if index not in self.blocks[key]:
+                self.blocks[key].append(index)
+    
+    def _is_match(self, a, b):
+        # The locator's own ids are authoritative when both sides have one
+        if a.get("locator_id") is not None and b.get("locator_id") is not None:
+            return a["locator_id"] == b["locator_id"]
+        
+        if _has_coordinates(a) and _has_coordinates(b) and _distance_m(a, b) > self.max_distance_m:
+            return False
+        
+        name_a, name_b = normalize_text(a.get("name")), normalize_text(b.get("name"))
+        if name_a and name_b:
+            if _similarity(name_a, name_b) < self.name_threshold:
+                return False
+            # "Jalan Ipoh" and "Jalan Ipoh 2" are separate outlets
+            if re.findall(r"\d+", name_a) != re.findall(r"\d+", name_b):
+                return False
+        
+        # A missing address cannot contradict a match on name
+        address_a, address_b = normalize_text(a.get("address")), normalize_text(b.get("address"))
+        if not address_a or not address_b:
+            return bool(name_a and name_b)
+        return _similarity(address_a, address_b) >= self.address_threshold
+    
+    def _merge(self, record, duplicate):
+        for field in MERGE_FIELDS:
+            if record.get(field) in (None, "") and duplicate.get(field) not in (None, ""):
+                record[field] = duplicate[field]
+
+def dedupe_outlets(outlets):
+    """Return outlets with duplicates merged away, keeping first-seen order"""
+    deduplicator = OutletDeduplicator()
+    unique = [outlet for outlet in outlets if not deduplicator.add(outlet)[1]]
+    if deduplicator.duplicates:
+        logger.info(f"Merged {deduplicator.duplicates} duplicate outlets")
+    return unique
@@ -0,0 +1,447 @@
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from ..scraper.scraper import SubwayScraper, ExtractionAborted
+from ..scraper.main import create_tables
+from ..scraper.outlet_pages import OutletPageFetcher, parse_outlet_page
+from .dedup import OutletDeduplicator, MERGE_FIELDS
+from ..analytics.neighbours import get_neighbour_graph
+from ..utils.geocoder import Geocoder
+from ..database.database import SessionLocal
+from ..database.models import (
+    SubwayOutlet, PipelineCheckpoint, OutletFingerprint, bump_dataset_version
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Maximum number of outlets buffered between two stages. A full queue blocks
+# the upstream stage, so a slow geocoder throttles extraction instead of
+# letting outlets pile up in memory.
+QUEUE_SIZE = 32
+
+# Number of outlets stored per database commit
+BATCH_SIZE = 20
+
+# Minimum delay between Nominatim requests, in seconds
+GEOCODE_INTERVAL = 1.0
+
+# How long a stage waits on a queue before re-checking for shutdown
+POLL_INTERVAL = 0.5
+
+# Number of newly extracted outlets held back before being passed on, so
+# duplicates from nested containers can still be merged into them
+DEDUP_WINDOW = 8
+
+# Marks the end of the stream on a queue
+_DONE = object()
+
+# Listing fields that make up an outlet's change-detection fingerprint
+FINGERPRINT_FIELDS = ("name", "address", "operating_hours", "waze_link", "latitude", "longitude")
+
+def outlet_key(outlet):
+    """Build a stable key for an outlet from its normalized name and address"""
+    parts = [" ".join((outlet.get(field) or "").lower().split()) for field in ("name", "address")]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+def outlet_fingerprint(outlet):
+    """Hash the listing fields of an outlet so unchanged outlets can be skipped"""
+    parts = ["" if outlet.get(field) is None else str(outlet.get(field)) for field in FINGERPRINT_FIELDS]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class Pipeline:
+    """Scrape, geocode and store outlets as overlapping streaming stages"""
+    
+    def __init__(self, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, incremental=False):
+        self.extracted = queue.Queue(maxsize=queue_size)
+        self.resolved = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.geocoder = Geocoder()
+        self.page_fetcher = OutletPageFetcher() if incremental else None
+        self.deduplicator = OutletDeduplicator()
+        # Records waiting out the dedup window, and copies already sent downstream
+        self.held = OrderedDict()
+        self.emitted = {}
+        # Outlet ids written by the store stage, keyed by outlet key
+        self.stored_ids = {}
+        self.stop_event = threading.Event()
+        self.failed = False
+        # Keys stored by a previous, interrupted run
+        self.checkpointed_keys = set()
+        # Keys extracted during this run
+        self.seen_keys = set()
+        # Stored fingerprints as {locator_id: (fingerprint, outlet_id)}
+        self.fingerprints = {}
+        # Stored outlets that could not be geocoded, retried even when unchanged
+        self.ungeocoded_ids = set()
+        self.seen_locator_ids = set()
+        self.stats = {"extracted": 0, "duplicates": 0, "resumed": 0, "unchanged": 0, "geocoded": 0, "stored": 0}
+    
+    def run(self):
+        """Run all stages to completion and return True if the refresh finished"""
+        self._load_checkpoint()
+        
+        workers = [
+            threading.Thread(target=self._stage, args=(self._resolve_stage,), name="resolve"),
+            threading.Thread(target=self._stage, args=(self._store_stage,), name="store"),
+        ]
+        for worker in workers:
+            worker.start()
+        
+        # Extraction drives Selenium, so it runs on the calling thread
+        try:
+            scraper = SubwayScraper(on_outlet=self._on_extracted)
+            scraper.scrape_outlets()
+            
+            # A scrape that broke off midway must not be treated as a full listing
+            if scraper.error:
+                self._abort()
+            else:
+                self._flush_held()
+        except Exception as e:
+            logger.error(f"Extraction stage failed: {str(e)}")
+            self._abort()
+        finally:
+            self._put(self.extracted, _DONE)
+        
+        for worker in workers:
+            worker.join()
+        
+        logger.info(
+            f"Pipeline stats: {self.stats['extracted']} extracted, {self.stats['duplicates']} duplicates merged, "
+            f"{self.stats['resumed']} resumed "
+            f"from checkpoint, {self.stats['unchanged']} unchanged, {self.stats['geocoded']} geocoded, "
+            f"{self.stats['stored']} stored"
+        )
+        if self.page_fetcher:
+            logger.info(
+                f"Outlet pages: {self.page_fetcher.stats['fetched']} fetched, "
+                f"{self.page_fetcher.stats['not_modified']} not modified, "
+                f"{self.page_fetcher.stats['failed']} failed"
+            )
+        
+        if self.failed:
+            logger.error("Pipeline did not finish; rerun to resume from the last checkpoint")
+            return False
+        
+        if not self.stats["extracted"]:
+            logger.warning("No outlets were scraped; keeping the existing data and checkpoint")
+            return False
+        
+        self._finalize()
+        self._refresh_neighbour_graph()
+        return True
+    
+    def _stage(self, target):
+        """Run a worker stage, stopping the whole pipeline if it fails"""
+        try:
+            target()
+        except Exception as e:
+            logger.error(f"Stage {threading.current_thread().name} failed: {str(e)}")
+            self._abort()
+    
+    def _abort(self):
+        self.failed = True
+        self.stop_event.set()
+    
+    def _put(self, stage_queue, item):
+        """Block until there is room on the queue, unless the pipeline has stopped"""
+        while not self.stop_event.is_set():
+            try:
+                stage_queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _get(self, stage_queue):
+        """Block until an item is available, returning _DONE if the pipeline has stopped"""
+        while not self.stop_event.is_set():
+            try:
+                return stage_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _DONE
+    
+    def _load_checkpoint(self):
+        db = SessionLocal()
+        try:
+            self.checkpointed_keys = {row.outlet_key for row in db.query(PipelineCheckpoint.outlet_key)}
+            self.fingerprints = {
+                row.locator_id: (row.fingerprint, row.outlet_id) for row in db.query(OutletFingerprint)
+            }
+            self.ungeocoded_ids = {
+                row.id for row in db.query(SubwayOutlet.id).filter(
+                    (SubwayOutlet.latitude.is_(None)) | (SubwayOutlet.longitude.is_(None))
+                )
+            }
+        finally:
+            db.close()
+        
+        if self.checkpointed_keys:
+            logger.info(f"Resuming from checkpoint with {len(self.checkpointed_keys)} outlets already stored")
+    
+    def _on_extracted(self, outlet):
+        """Extraction stage: deduplicate each scraped outlet and hand it to the resolve stage"""
+        # Stop Selenium as soon as a downstream stage has failed
+        if self.stop_event.is_set():
+            raise ExtractionAborted()
+        
+        if outlet.get("locator_id") is not None:
+            self.seen_locator_ids.add(outlet["locator_id"])
+        
+        # Nested containers in the locator markup yield the same outlet several times
+        record, is_duplicate = self.deduplicator.add(outlet)
+        if is_duplicate:
+            self.stats["duplicates"] += 1
+            sent = self.emitted.get(id(record))
+            # Fields merged after the record went downstream are sent again as an update
+            if sent is not None and any(sent.get(field) != record.get(field) for field in MERGE_FIELDS):
+                self._emit(record, previous=sent)
+            return
+        
+        self.held[id(record)] = record
+        while len(self.held) > DEDUP_WINDOW:
+            _, oldest = self.held.popitem(last=False)
+            self._emit(oldest)
+    
+    def _flush_held(self):
+        while self.held:
+            _, oldest = self.held.popitem(last=False)
+            self._emit(oldest)
+    
+    def _emit(self, record, previous=None):
+        """Pass a copy of a deduplicated record downstream"""
+        # A copy, since later duplicates are merged into the indexed record
+        outlet = dict(record)
+        if previous is not None:
+            # An update for an outlet already in flight keeps its original key
+            outlet["key"] = previous["key"]
+        else:
+            key = outlet_key(outlet)
+            if key in self.seen_keys:
+                return
+            
+            self.seen_keys.add(key)
+            self.stats["extracted"] += 1
+            
+            if key in self.checkpointed_keys:
+                self.stats["resumed"] += 1
+                return
+            outlet["key"] = key
+        
+        outlet["fingerprint"] = outlet_fingerprint(outlet)
+        
+        # Incremental refreshes only pass new or changed outlets downstream
+        locator_id = outlet.get("locator_id")
+        if previous is None and self.incremental and locator_id in self.fingerprints:
+            fingerprint, outlet_id = self.fingerprints[locator_id]
+            if fingerprint == outlet["fingerprint"] and outlet_id not in self.ungeocoded_ids:
+                self.stats["unchanged"] += 1
+                return
+        
+        if not self._put(self.extracted, outlet):
+            raise ExtractionAborted()
+        self.emitted[id(record)] = outlet
+    
+    def _resolve_stage(self):
+        """Coordinate resolution stage: fill in latitude/longitude for each outlet"""
+        db = SessionLocal()
+        last_request = 0.0
+        try:
+            while True:
+                outlet = self._get(self.extracted)
+                if outlet is _DONE:
+                    break
+                
+                if self.page_fetcher and outlet.get("locator_id") is not None:
+                    self._merge_outlet_page(outlet)
+                
+                if outlet.get("latitude") is None or outlet.get("longitude") is None:
+                    # Reuse coordinates from a previous refresh before asking Nominatim,
+                    # unless the outlet's address has changed since
+                    existing = self._find_existing(db, outlet)
+                    if (existing and existing.latitude is not None and existing.longitude is not None
+                            and existing.address == outlet.get("address", "")):
+                        outlet["latitude"], outlet["longitude"] = existing.latitude, existing.longitude
+                    else:
+                        query = self.geocoder.build_query(outlet.get("name"), outlet.get("address"))
+                        if query:
+                            # Sleep to avoid hitting API rate limits
+                            wait = GEOCODE_INTERVAL - (time.monotonic() - last_request)
+                            if wait > 0:
+                                time.sleep(wait)
+                            last_request = time.monotonic()
+                            
+                            lat, lng = self.geocoder.geocode_address(query)
+                            if lat and lng:
+                                outlet["latitude"], outlet["longitude"] = lat, lng
+                                self.stats["geocoded"] += 1
+                
+                if not self._put(self.resolved, outlet):
+                    break
+        finally:
+            self._put(self.resolved, _DONE)
+            db.close()
+    
+    def _store_stage(self):
+        """Storage stage: upsert outlets and checkpoint them in batched commits"""
+        db = SessionLocal()
+        pending = 0
+        try:
+            while True:
+                outlet = self._get(self.resolved)
+                if outlet is _DONE:
+                    break
+                
+                self._upsert(db, outlet)
+                pending += 1
+                
+                if pending >= self.batch_size:
+                    # Each batch is visible as soon as it commits, so it gets its own version
+                    bump_dataset_version(db)
+                    db.commit()
+                    self.stats["stored"] += pending
+                    pending = 0
+            
+            # Only flush the last partial batch if the stream ended normally
+            if pending and not self.stop_event.is_set():
+                bump_dataset_version(db)
+                db.commit()
+                self.stats["stored"] += pending
+        finally:
+            db.close()
+    
+    def _merge_outlet_page(self, outlet):
+        """Fill in fields the listing left blank from the outlet's own page"""
+        html = self.page_fetcher.fetch(outlet["locator_id"])
+        if not html:
+            return
+        
+        for field, value in parse_outlet_page(html).items():
+            if outlet.get(field) in (None, ""):
+                outlet[field] = value
+    
+    def _find_existing(self, db, outlet):
+        # Updates for an outlet stored earlier in this run go to the same row
+        if outlet.get("key") in self.stored_ids:
+            existing = db.query(SubwayOutlet).filter(
+                SubwayOutlet.id == self.stored_ids[outlet["key"]]
+            ).first()
+            if existing:
+                return existing
+        
+        # Prefer the row recorded for this locator id, since names and addresses can change
+        locator_id = outlet.get("locator_id")
+        if locator_id in self.fingerprints:
+            existing = db.query(SubwayOutlet).filter(
+                SubwayOutlet.id == self.fingerprints[locator_id][1]
+            ).first()
+            if existing:
+                return existing
+        
+        return db.query(SubwayOutlet).filter(
+            SubwayOutlet.name == outlet.get("name", "Unknown"),
+            SubwayOutlet.address == outlet.get("address", "")
+        ).first()
+    
+    def _upsert(self, db, outlet_data):
+        outlet = self._find_existing(db, outlet_data)
+        if outlet is None:
+            outlet = SubwayOutlet()
+            db.add(outlet)
+        
+        # Rows matched by locator id may have been renamed or moved
+        outlet.name = outlet_data.get("name", "Unknown")
+        outlet.address = outlet_data.get("address", "")
+        outlet.operating_hours = outlet_data.get("operating_hours", "")
+        outlet.waze_link = outlet_data.get("waze_link", "")
+        outlet.latitude = outlet_data.get("latitude")
+        outlet.longitude = outlet_data.get("longitude")
+        db.flush()
+        self.stored_ids[outlet_data["key"]] = outlet.id
+        
+        # The checkpoint and fingerprint rows are committed in the same transaction as the outlet
+        db.merge(PipelineCheckpoint(outlet_key=outlet_data["key"], outlet_id=outlet.id))
+        if outlet_data.get("locator_id") is not None:
+            db.merge(OutletFingerprint(
+                locator_id=outlet_data["locator_id"],
+                outlet_id=outlet.id,
+                fingerprint=outlet_data["fingerprint"]
+            ))
+    
+    def _finalize(self):
+        """Drop outlets that were not seen in this refresh and clear the checkpoint"""
+        db = SessionLocal()
+        try:
+            if self.incremental:
+                # Unchanged outlets were never stored, so only ids that vanished from the listing go
+                removed_ids = [
+                    outlet_id for locator_id, (_, outlet_id) in self.fingerprints.items()
+                    if locator_id not in self.seen_locator_ids
+                ]
+                # Outlets without a locator id are only known by their name and address
+                kept_ids = {row.outlet_id for row in db.query(OutletFingerprint.outlet_id)}
+                kept_ids.update(self.stored_ids.values())
+                removed_ids += [
+                    row.id for row in db.query(SubwayOutlet.id, SubwayOutlet.name, SubwayOutlet.address)
+                    if row.id not in kept_ids
+                    and outlet_key({"name": row.name, "address": row.address}) not in self.seen_keys
+                ]
+                removed = db.query(SubwayOutlet).filter(
+                    SubwayOutlet.id.in_(removed_ids)
+                ).delete(synchronize_session=False)
+                db.query(OutletFingerprint).filter(
+                    OutletFingerprint.outlet_id.in_(removed_ids)
+                ).delete(synchronize_session=False)
+            else:
+                keep_ids = [
+                    row.outlet_id for row in db.query(PipelineCheckpoint)
+                    if row.outlet_key in self.seen_keys
+                ]
+                removed = db.query(SubwayOutlet).filter(
+                    SubwayOutlet.id.notin_(keep_ids)
+                ).delete(synchronize_session=False)
+                db.query(OutletFingerprint).filter(
+                    OutletFingerprint.outlet_id.notin_(keep_ids)
+                ).delete(synchronize_session=False)
+            
+            # Stored batches bumped the version as they committed
+            if removed:
+                bump_dataset_version(db)
+            db.query(PipelineCheckpoint).delete()
+            db.commit()
+            logger.info(f"Refresh completed; removed {removed} outlets no longer listed")
+        finally:
+            db.close()
+    
+    def _refresh_neighbour_graph(self):
+        """Rebuild the neighbour graph now, so analytics reads stay instant after a refresh"""
+        db = SessionLocal()
+        try:
+            get_neighbour_graph(db)
+        except Exception as e:
+            logger.warning(f"Could not refresh neighbour graph: {str(e)}")
+        finally:
+            db.close()
+
+def run(incremental=False):
+    """Run the streaming scrape -> geocode -> store pipeline"""
+    logger.info(f"Starting {'incremental' if incremental else 'full'} pipeline")
+    create_tables()
+    pipeline = Pipeline(incremental=incremental)
+    if pipeline.run():
+        logger.info("Pipeline completed successfully")
+    else:
+        logger.warning("Pipeline did not complete")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEBUG_DIR = os.getenv("DEBUG_DIR", "debug")
+
+# Which captures are written: "all", "sample" (failures plus a random
+# sample of the rest), "failure" (only failure-triggered captures) or "off"
+CAPTURE_MODE = os.getenv("DEBUG_CAPTURE", "failure")
+SAMPLE_RATE = float(os.getenv("DEBUG_SAMPLE_RATE", "0.05"))
+
+# Number of run manifests kept; blobs no longer referenced by any of them are deleted
+RETAIN_RUNS = int(os.getenv("DEBUG_RETAIN_RUNS", "10"))
+
+# Blobs younger than this are never collected, since a concurrent run may
+# have written them without having published its manifest yet
+GC_GRACE_SECONDS = 3600
+
+class DebugStore:
+    """Content-addressed, compressed store for scraper debug captures"""
+    
+    def __init__(self, root=DEBUG_DIR, mode=CAPTURE_MODE, sample_rate=SAMPLE_RATE, retain_runs=RETAIN_RUNS):
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.runs_dir = os.path.join(root, "runs")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        # The current run's manifest is always kept
+        self.retain_runs = max(retain_runs, 1)
+        self.codec = "zst" if zstandard else "gz"
+        self.run_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.started_at = datetime.utcnow().isoformat()
+        self.captures = []
+        self.closed = False
+    
+    @property
+    def manifest_path(self):
+        return os.path.join(self.runs_dir, f"{self.run_id}.json")
+    
+    def capture(self, name, data, failure=False):
+        """Store a capture if the capture policy selects it and return its digest
+        
+        data may be bytes, str, or a callable returning either, so expensive
+        captures such as screenshots are only taken when they will be kept.
+        """
+        if not self._should_capture(failure):
+            return None
+        
+        try:
+            if callable(data):
+                data = data()
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._blob_path(digest)
+            
+            # Identical content is only ever written once, across all runs. Reused
+            # blobs are touched so the GC grace period covers this run's use of them.
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(self._compress(data))
+                os.replace(tmp_path, path)
+            
+            self.captures.append({
+                "name": name,
+                "digest": digest,
+                "size": len(data),
+                "failure": failure
+            })
+            return digest
+        except Exception as e:
+            logger.warning(f"Could not store debug capture {name}: {str(e)}")
+            return None
+    
+    def read(self, digest):
+        """Return the decompressed content of a stored capture"""
+        for codec in ("zst", "gz"):
+            path = os.path.join(self.blobs_dir, digest[:2], f"{digest}.{codec}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return self._decompress(f.read(), codec)
+        raise FileNotFoundError(f"No debug capture with digest {digest}")
+    
+    def close(self, failed=False):
+        """Write this run's manifest and apply the retention policy"""
+        if self.closed:
+            return
+        self.closed = True
+        
+        os.makedirs(self.runs_dir, exist_ok=True)
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "run_id": self.run_id,
+                "started_at": self.started_at,
+                "finished_at": datetime.utcnow().isoformat(),
+                "failed": failed,
+                "mode": self.mode,
+                "codec": self.codec,
+                "captures": self.captures
+            }, f, indent=2)
+        logger.info(f"Stored {len(self.captures)} debug captures, listed in {self.manifest_path}")
+        
+        try:
+            self._apply_retention()
+        except OSError as e:
+            logger.warning(f"Could not apply debug retention policy: {str(e)}")
+    
+    def _should_capture(self, failure):
+        if self.mode == "all":
+            return True
+        if self.mode == "off":
+            return False
+        if failure:
+            return True
+        return self.mode == "sample" and random.random() < self.sample_rate
+    
+    def _blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[:2], f"{digest}.{self.codec}")
+    
+    def _compress(self, data):
+        if self.codec == "zst":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data)
+    
+    def _decompress(self, data, codec):
+        if codec == "zst":
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read .zst debug captures")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+    
+    def _apply_retention(self):
+        """Drop the oldest run manifests and any blobs no remaining run refers to"""
+        # Oldest first; the current run is always last so it can never expire
+        own_manifest = os.path.basename(self.manifest_path)
+        manifests = sorted(
+            (name for name in os.listdir(self.runs_dir) if name.endswith(".json") and name != own_manifest),
+            key=lambda name: (os.path.getmtime(os.path.join(self.runs_dir, name)), name)
+        )
+        expired = manifests[:max(0, len(manifests) - (self.retain_runs - 1))]
+        for name in expired:
+            os.remove(os.path.join(self.runs_dir, name))
+        
+        referenced = set()
+        for name in os.listdir(self.runs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.runs_dir, name), "r", encoding="utf-8") as f:
+                    referenced.update(capture["digest"] for capture in json.load(f)["captures"])
+            except (OSError, ValueError, KeyError):
+                # Keep every blob rather than risk deleting one a damaged manifest refers to
+                return
+        
+        removed = 0
+        cutoff = time.time() - GC_GRACE_SECONDS
+        for prefix in os.listdir(self.blobs_dir) if os.path.exists(self.blobs_dir) else []:
+            prefix_dir = os.path.join(self.blobs_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                if name.split(".", 1)[0] not in referenced and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        
+        if expired or removed:
+            logger.info(f"Debug retention removed {len(expired)} runs and {removed} blobs")
@@ -1,9 +1,9 @@
 import logging
-import os
 from .scraper import SubwayScraper
 from sqlalchemy.orm import Session
 from ..database.database import engine, Base, SessionLocal
-from ..database.models import SubwayOutlet
+from ..database.models import SubwayOutlet, PipelineCheckpoint, OutletFingerprint, bump_dataset_version
+from ..pipeline.dedup import dedupe_outlets
 
 # Configure logging
 logging.basicConfig(
@@ -19,8 +19,13 @@ def create_tables():
 
 def store_outlets(outlets, db: Session):
     """Store outlet data in the database"""
+    outlets = dedupe_outlets(outlets)
+    
     # First, clear existing data
     db.query(SubwayOutlet).delete()
+    # Outlet ids are reused after the delete, so rows pointing at them would go stale
+    db.query(OutletFingerprint).delete()
+    db.query(PipelineCheckpoint).delete()
     logger.info("Cleared existing outlets from database")
     
     for outlet_data in outlets:
@@ -28,10 +33,13 @@ def store_outlets(outlets, db: Session):
             name=outlet_data.get("name", "Unknown"),
             address=outlet_data.get("address", ""),
             operating_hours=outlet_data.get("operating_hours", ""),
-            waze_link=outlet_data.get("waze_link", "")
+            waze_link=outlet_data.get("waze_link", ""),
+            latitude=outlet_data.get("latitude"),
+            longitude=outlet_data.get("longitude")
         )
         db.add(outlet)
     
+    bump_dataset_version(db)
     db.commit()
     logger.info(f"Stored {len(outlets)} outlets in database")
 
@@ -39,9 +47,6 @@ def run():
     """Run the scraper and store the data"""
     logger.info("Starting the scraping process")
     
-    # Create debug directory
-    os.makedirs("debug", exist_ok=True)
-    
     # Create database tables
     create_tables()
     
@@ -62,10 +67,11 @@ def run():
         logger.warning("No outlets were scraped")
         
         # Try to display some debug info about what might be wrong
-        debug_files = os.listdir("debug") if os.path.exists("debug") else []
-        if debug_files:
-            logger.info(f"Debug files available in the debug folder: {', '.join(debug_files)}")
-            logger.info("Check these files to understand what might be wrong with the scraping process")
+        if scraper.debug_store.captures:
+            names = ', '.join(capture["name"] for capture in scraper.debug_store.captures)
+            logger.info(f"Debug captures for this run: {names}")
+            logger.info(f"See {scraper.debug_store.manifest_path} for their blob digests")
+            logger.info("Check these captures to understand what might be wrong with the scraping process")
         
         # Suggestions for troubleshooting
         logger.info("Troubleshooting suggestions:")
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import re
+import requests
+from bs4 import BeautifulSoup
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Local cache of per-outlet pages and their validators
+CACHE_DIR = os.path.join("cache", "outlet_pages")
+
+class OutletPageFetcher:
+    """Fetch /find-a-subway?id=N&view=location pages with conditional requests"""
+    
+    def __init__(self, base_url="https://subway.com.my/find-a-subway", cache_dir=CACHE_DIR):
+        self.base_url = base_url
+        self.cache_dir = cache_dir
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36"
+        self.stats = {"fetched": 0, "not_modified": 0, "failed": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def fetch(self, locator_id):
+        """Return the page HTML for an outlet, reusing the cached copy when unchanged"""
+        body_path, meta_path = self._cache_paths(locator_id)
+        meta = self._read_meta(meta_path)
+        
+        # Only send validators if we still have the body they refer to
+        headers = {}
+        if meta and os.path.exists(body_path):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        
+        try:
+            response = self.session.get(
+                self.base_url,
+                params={"id": locator_id, "view": "location"},
+                headers=headers,
+                timeout=30
+            )
+        except requests.RequestException as e:
+            logger.warning(f"Could not fetch page for outlet {locator_id}: {str(e)}")
+            self.stats["failed"] += 1
+            return None
+        
+        if response.status_code == 304:
+            self.stats["not_modified"] += 1
+            with open(body_path, "r", encoding="utf-8") as f:
+                return f.read()
+        
+        if response.status_code != 200:
+            logger.warning(f"Page for outlet {locator_id} returned HTTP {response.status_code}")
+            self.stats["failed"] += 1
+            return None
+        
+        self.stats["fetched"] += 1
+        with open(body_path, "w", encoding="utf-8") as f:
+            f.write(response.text)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")
+            }, f)
+        
+        return response.text
+    
+    def _cache_paths(self, locator_id):
+        base = os.path.join(self.cache_dir, str(locator_id))
+        return f"{base}.html", f"{base}.json"
+    
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+def parse_outlet_page(html):
+    """Extract whatever outlet fields an outlet page provides"""
+    soup = BeautifulSoup(html, 'html.parser')
+    details = {}
+    
+    # Coordinates are carried as data attributes, as in the listing markup
+    marker = soup.find(attrs={"data-latitude": True, "data-longitude": True})
+    if marker:
+        try:
+            details["latitude"] = float(marker["data-latitude"])
+            details["longitude"] = float(marker["data-longitude"])
+        except ValueError:
+            pass
+    
+    waze = soup.find('a', href=lambda h: h and 'waze' in h.lower())
+    if waze:
+        details["waze_link"] = waze["href"]
+    
+    # The info box lists the address first, followed by the opening hours
+    content = soup.find(class_="infoboxcontent")
+    if content:
+        paragraphs = [p.get_text(strip=True) for p in content.find_all('p')]
+        paragraphs = [text for text in paragraphs if text and "find out more" not in text.lower()]
+        if paragraphs:
+            details["address"] = paragraphs[0]
+        for text in paragraphs[1:]:
+            if re.search(r"\d{1,2}[:.]\d{2}\s*[AP]M", text, re.IGNORECASE):
+                details["operating_hours"] = text
+                break
+    
+    return details
@@ -2,7 +2,7 @@ import requests
 from bs4 import BeautifulSoup
 import time
 import logging
-import os
+import re
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -11,6 +11,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementNotInteractableException
 from webdriver_manager.chrome import ChromeDriverManager
+from .debug_store import DebugStore
 
 # Configure logging
 logging.basicConfig(
@@ -19,10 +20,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class ExtractionAborted(Exception):
+    """Raised by an on_outlet callback to stop scraping early"""
+
 class SubwayScraper:
-    def __init__(self):
+    def __init__(self, on_outlet=None, debug_store=None):
         self.base_url = "https://subway.com.my/find-a-subway"
         self.outlets = []
+        self.outlet_count = 0
+        self.error = None
+        # When set, extracted outlets are streamed to this callback instead
+        # of being collected in self.outlets
+        self.on_outlet = on_outlet
+        self.debug_store = debug_store or DebugStore()
         
     def setup_driver(self):
         """Initialize the Selenium WebDriver with Chrome"""
@@ -58,17 +68,9 @@ class SubwayScraper:
             # Wait longer for the page to load completely
             time.sleep(10)
             
-            # Create debug directory if it doesn't exist
-            os.makedirs("debug", exist_ok=True)
-            
-            # Take screenshot for debugging
-            driver.save_screenshot("debug/initial_page.png")
-            logger.info("Saved initial page screenshot")
-            
-            # Save page source for analysis
-            with open("debug/initial_page.html", "w", encoding="utf-8") as f:
-                f.write(driver.page_source)
-            logger.info("Saved initial page source")
+            # Capture the initial page for debugging (sampled)
+            self.debug_store.capture("initial_page.png", driver.get_screenshot_as_png)
+            self.debug_store.capture("initial_page.html", lambda: driver.page_source)
             
             # Look for the search input using multiple strategies
             search_input = None
@@ -100,6 +102,8 @@ class SubwayScraper:
             
             if not search_input:
                 logger.error("Could not find search input using any strategy")
+                self.debug_store.capture("initial_page.png", driver.get_screenshot_as_png, failure=True)
+                self.debug_store.capture("initial_page.html", lambda: driver.page_source, failure=True)
                 # Try to identify form elements to understand the page structure
                 forms = driver.find_elements(By.TAG_NAME, "form")
                 logger.info(f"Found {len(forms)} form elements")
@@ -116,7 +120,7 @@ class SubwayScraper:
                         driver.switch_to.frame(iframe)
                         
                         # Take screenshot inside iframe
-                        driver.save_screenshot(f"debug/iframe_{i}.png")
+                        self.debug_store.capture(f"iframe_{i}.png", driver.get_screenshot_as_png, failure=True)
                         
                         # Try to find search input inside iframe
                         for strategy in search_strategies:
@@ -175,14 +179,9 @@ class SubwayScraper:
                         # Wait for results to load
                         time.sleep(5)
                         
-                        # Take screenshot after search
-                        driver.save_screenshot("debug/after_search.png")
-                        logger.info("Saved screenshot after search")
-                        
-                        # Save page source after search
-                        with open("debug/after_search.html", "w", encoding="utf-8") as f:
-                            f.write(driver.page_source)
-                        logger.info("Saved page source after search")
+                        # Capture the results page for debugging (sampled)
+                        self.debug_store.capture("after_search.png", driver.get_screenshot_as_png)
+                        self.debug_store.capture("after_search.html", lambda: driver.page_source)
                         
                         # Try to identify the results container
                         result_strategies = [
@@ -210,6 +209,8 @@ class SubwayScraper:
                             self._extract_outlets_from_results(driver, results_container)
                         else:
                             logger.error("Could not find results container")
+                            self.debug_store.capture("after_search.png", driver.get_screenshot_as_png, failure=True)
+                            self.debug_store.capture("after_search.html", lambda: driver.page_source, failure=True)
                             # Try a more generic approach to find outlet information
                             self._extract_outlets_generic(driver)
                     else:
@@ -218,6 +219,8 @@ class SubwayScraper:
                         search_input.send_keys("\n")  # Try pressing Enter
                         time.sleep(5)
                         self._extract_outlets_generic(driver)
+                except ExtractionAborted:
+                    raise
                 except Exception as e:
                     logger.error(f"Error during search: {str(e)}")
                     # Try a more generic approach
@@ -227,16 +230,23 @@ class SubwayScraper:
                 # Try a more generic approach
                 self._extract_outlets_generic(driver)
             
-            logger.info(f"Scraping completed. Total outlets scraped: {len(self.outlets)}")
+            logger.info(f"Scraping completed. Total outlets scraped: {self.outlet_count}")
             return self.outlets
             
+        except ExtractionAborted as e:
+            logger.warning("Scraping stopped by the outlet consumer")
+            self.error = e
+            return []
+            
         except Exception as e:
             logger.error(f"An error occurred during scraping: {str(e)}")
+            self.error = e
             return []
             
         finally:
             driver.quit()
             logger.info("WebDriver closed")
+            self.debug_store.close(failed=bool(self.error) or not self.outlet_count)
     
     def _extract_outlets_from_results(self, driver, results_container):
         """Extract outlet information from the results container"""
@@ -272,9 +282,8 @@ class SubwayScraper:
         # Process each outlet element
         for i, outlet in enumerate(outlet_elements):
             try:
-                # Save outlet HTML for debugging
-                with open(f"debug/outlet_{i}.html", "w", encoding="utf-8") as f:
-                    f.write(outlet.get_attribute('outerHTML'))
+                # Capture outlet HTML for debugging (sampled)
+                self.debug_store.capture(f"outlet_{i}.html", lambda: outlet.get_attribute('outerHTML'))
                 
                 # Extract outlet information using multiple strategies
                 name = self._extract_text(outlet, [
@@ -298,34 +307,47 @@ class SubwayScraper:
                     (By.XPATH, "//span[contains(text(), 'Hours')]")
                 ])
                 
-                # Extract Waze link
+                # Extract Waze link and the locator's own id for this outlet
                 waze_link = ""
+                locator_id = None
                 link_elements = outlet.find_elements(By.TAG_NAME, "a")
                 for link in link_elements:
                     href = link.get_attribute("href")
-                    if href and "waze" in href.lower():
+                    if href and "waze" in href.lower() and not waze_link:
                         waze_link = href
-                        break
+                    if locator_id is None:
+                        locator_id = self._parse_locator_id(href)
+                
+                # The locator markup carries coordinates on the list item itself
+                latitude = self._parse_coordinate(outlet.get_attribute("data-latitude"))
+                longitude = self._parse_coordinate(outlet.get_attribute("data-longitude"))
                 
                 # Only add the outlet if we at least have a name or address
                 if name or address:
-                    self.outlets.append({
+                    self._add_outlet({
                         "name": name,
                         "address": address,
                         "operating_hours": hours,
-                        "waze_link": waze_link
+                        "waze_link": waze_link,
+                        "latitude": latitude,
+                        "longitude": longitude,
+                        "locator_id": locator_id
                     })
                     logger.info(f"Added outlet: {name or 'Unknown'}")
+                else:
+                    self.debug_store.capture(f"outlet_{i}.html", lambda: outlet.get_attribute('outerHTML'), failure=True)
+            except ExtractionAborted:
+                raise
             except Exception as e:
                 logger.error(f"Error extracting outlet {i}: {str(e)}")
+                self.debug_store.capture(f"outlet_{i}.html", lambda: outlet.get_attribute('outerHTML'), failure=True)
     
     def _extract_outlets_generic(self, driver):
         """Extract outlet information using a more generic approach"""
         logger.info("Trying to extract outlets using generic approach")
         
-        # Save the page source
-        with open("debug/generic_extraction.html", "w", encoding="utf-8") as f:
-            f.write(driver.page_source)
+        # Falling back to generic extraction means the expected markup was not found
+        self.debug_store.capture("generic_extraction.html", lambda: driver.page_source, failure=True)
         
         # Use BeautifulSoup for more flexible parsing
         soup = BeautifulSoup(driver.page_source, 'html.parser')
@@ -352,7 +374,7 @@ class SubwayScraper:
         if name_elements and address_elements and len(name_elements) == len(address_elements):
             logger.info("Matching names with addresses based on position")
             for i in range(len(name_elements)):
-                self.outlets.append({
+                self._add_outlet({
                     "name": name_elements[i].get_text(strip=True),
                     "address": address_elements[i].get_text(strip=True),
                     "operating_hours": "",
@@ -360,7 +382,7 @@ class SubwayScraper:
                 })
         
         # If we still haven't found any outlets, try to extract from Waze links
-        if not self.outlets and waze_links:
+        if not self.outlet_count and waze_links:
             logger.info("Extracting outlets from Waze links")
             for link in waze_links:
                 # Try to find a parent element that might contain the outlet info
@@ -384,16 +406,48 @@ class SubwayScraper:
                         remaining_text = parent.get_text(strip=True).replace(name, '', 1)
                         address = remaining_text
                     
+                    # Look for the link to the outlet's own locator page
+                    locator_id = None
+                    for outlet_link in parent.find_all('a'):
+                        locator_id = self._parse_locator_id(outlet_link.get('href'))
+                        if locator_id is not None:
+                            break
+                    
                     # Only add if we have at least some information
                     if name or address:
-                        self.outlets.append({
+                        self._add_outlet({
                             "name": name,
                             "address": address,
                             "operating_hours": hours,
-                            "waze_link": link.get('href', '')
+                            "waze_link": link.get('href', ''),
+                            "latitude": self._parse_coordinate(parent.get('data-latitude')),
+                            "longitude": self._parse_coordinate(parent.get('data-longitude')),
+                            "locator_id": locator_id
                         })
         
-        logger.info(f"Generic extraction found {len(self.outlets)} outlets")
+        logger.info(f"Generic extraction found {self.outlet_count} outlets")
+    
+    def _add_outlet(self, outlet):
+        """Record an extracted outlet, streaming it to on_outlet when set"""
+        self.outlet_count += 1
+        if self.on_outlet:
+            self.on_outlet(outlet)
+        else:
+            self.outlets.append(outlet)
+    
+    def _parse_coordinate(self, value):
+        """Parse a data-latitude/data-longitude attribute, if present"""
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+    
+    def _parse_locator_id(self, href):
+        """Extract N from a /find-a-subway?id=N&view=location link, if present"""
+        match = re.search(r"[?&]id=(\d+)", href or "")
+        if match and "view=location" in href:
+            return int(match.group(1))
+        return None
     
     def _extract_text(self, element, strategies):
         """Extract text from an element using multiple strategies"""
@@ -3,7 +3,7 @@ import time
 from geopy.geocoders import Nominatim
 from sqlalchemy.orm import Session
 from ..database.database import SessionLocal
-from ..database.models import SubwayOutlet
+from ..database.models import SubwayOutlet, bump_dataset_version
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +36,23 @@ class Geocoder:
             logger.error(f"Error geocoding address {address}: {str(e)}")
             return None, None
     
+    def build_query(self, name, address):
+        """Build the geocoding query for an outlet from its address or name"""
+        if address:
+            return address
+        
+        # Try to geocode based on the outlet name if no address
+        # Extract location from name - replace "Subway" with empty string
+        location_name = (name or "").replace("Subway", "").strip()
+        
+        # If it's too short, it's probably not specific enough
+        if len(location_name) > 2:
+            query = f"{location_name}, Kuala Lumpur, Malaysia"
+            logger.info(f"Using outlet name for geocoding: {query}")
+            return query
+        
+        return None
+    
     def geocode_all_outlets(self):
         """Geocode all outlets in the database"""
         db = SessionLocal()
@@ -49,19 +66,7 @@ class Geocoder:
             logger.info(f"Found {len(outlets)} outlets to geocode")
             
             for outlet in outlets:
-                query = None
-                
-                # Try to geocode based on the outlet name if no address
-                if not outlet.address:
-                    # Extract location from name - replace "Subway" with empty string
-                    location_name = outlet.name.replace("Subway", "").strip()
-                    
-                    # If it's too short, it's probably not specific enough
-                    if len(location_name) > 2:
-                        query = f"{location_name}, Kuala Lumpur, Malaysia"
-                        logger.info(f"Using outlet name for geocoding: {query}")
-                else:
-                    query = outlet.address
+                query = self.build_query(outlet.name, outlet.address)
                     
                 # Skip if no query
                 if not query:
@@ -75,6 +80,7 @@ class Geocoder:
                 if lat and lng:
                     outlet.latitude = lat
                     outlet.longitude = lng
+                    bump_dataset_version(db)
                     db.commit()
                     logger.info(f"Updated coordinates for {outlet.name} using query: {query}")
                 